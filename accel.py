@@ -0,0 +1,26 @@
+"""
+Optional numba acceleration shared by app.py and utils.py
+Kernels are compiled when numba is installed and fall back to NumPy otherwise
+"""
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def jit_or_fallback(fallback):
+    """
+    Compile the decorated kernel with numba, or return fallback without numba
+
+    Args:
+        fallback: Equivalent pure-NumPy function with the same signature
+
+    Returns:
+        Decorator producing the compiled kernel or the fallback
+    """
+    def decorate(kernel):
+        if njit is None:
+            return fallback
+        return njit(cache=True, fastmath=True)(kernel)
+    return decorate
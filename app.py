@@ -1,16 +1,23 @@
 import streamlit as st
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.decomposition import PCA
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import os
 import logging
+import threading
+import time
+import itertools
+import diskcache
+from concurrent.futures import ThreadPoolExecutor
+from accel import jit_or_fallback
+from spotify_data import (
+    FEATURE_COLUMNS, MOOD_QUERIES, DATA_DIR, AUDIO_FEATURES_BATCH_SIZE, AUDIO_FEATURE_DEFAULTS,
+    connect_spotify, get_track_metadata, build_tracks_dataframe, scale_features, top_k_indices,
+    fetch_mood_recommendations as fetch_live_mood_recommendations
+)
+import spotify_data
 
 # Suppress Spotify API warnings
 logging.getLogger('spotipy').setLevel(logging.ERROR)
@@ -52,46 +59,65 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# Columns a candidate pool carries through filtering and ranking
+POOL_COLUMNS = ['id', 'popularity', 'year'] + FEATURE_COLUMNS
+
+# Track store: new entries are appended as parquet part files in this directory.
+# Up to TRACK_STORE_FLUSH_EVERY - 1 unflushed entries are lost on shutdown; they
+# are simply fetched again (usually from the Spotify disk cache) when next needed.
+TRACK_STORE_DIR = os.path.join(DATA_DIR, "track_cache")
+TRACK_STORE_FLUSH_EVERY = 100  # new tracks per part file
+TRACK_STORE_MAX_SIZE = 50000  # tracks kept in memory and on disk; oldest are dropped
+TRACK_STORE_MAX_PARTS = 50  # part files before they are compacted at startup
+
+# Worker threads for concurrent (I/O-bound) Spotify requests
+MAX_WORKERS = 8
+
+# Spotify responses are cached on disk so they survive app restarts
+SPOTIFY_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "spotify")
+spotify_disk_cache = diskcache.Cache(SPOTIFY_CACHE_DIR)
+
 @st.cache_resource
 def init_spotify():
     """Initialize Spotify API client"""
+    secrets = {}
     try:
-        client_id = None
-        client_secret = None
-        
-        # Try Streamlit secrets
-        if hasattr(st, 'secrets'):
-            try:
-                if "SPOTIFY_CLIENT_ID" in st.secrets:
-                    client_id = st.secrets["SPOTIFY_CLIENT_ID"]
-                    client_secret = st.secrets["SPOTIFY_CLIENT_SECRET"]
-            except Exception:
-                pass
-        
-        # Fallback to environment variables
-        if not client_id:
-            client_id = os.environ.get("SPOTIFY_CLIENT_ID") or os.getenv("SPOTIFY_CLIENT_ID")
-            client_secret = os.environ.get("SPOTIFY_CLIENT_SECRET") or os.getenv("SPOTIFY_CLIENT_SECRET")
-        
-        if not client_id or not client_secret:
-            return None, "missing_credentials"
-        
-        client_id = str(client_id).strip()
-        client_secret = str(client_secret).strip()
-        
-        auth_manager = SpotifyClientCredentials(
-            client_id=client_id,
-            client_secret=client_secret
-        )
-        sp = spotipy.Spotify(auth_manager=auth_manager)
-        
-        # Test connection
-        sp.search(q="test", type='track', limit=1)
-        
-        return sp, "success"
-        
-    except Exception as e:
-        return None, f"error: {str(e)}"
+        if "SPOTIFY_CLIENT_ID" in st.secrets:
+            secrets = {
+                "SPOTIFY_CLIENT_ID": st.secrets["SPOTIFY_CLIENT_ID"],
+                "SPOTIFY_CLIENT_SECRET": st.secrets["SPOTIFY_CLIENT_SECRET"]
+            }
+    except Exception:
+        pass
+    return connect_spotify(secrets)
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+@spotify_disk_cache.memoize(expire=86400, ignore=(0, '_sp'))
+def _cached_search(_sp, q, limit=1):
+    """Cached track search"""
+    return _sp.search(q=q, type='track', limit=limit)
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+@spotify_disk_cache.memoize(expire=86400, ignore=(0, '_sp'))
+def _cached_audio_features(_sp, track_ids):
+    """Cached audio features lookup (track_ids must be a tuple)"""
+    return _sp.audio_features(list(track_ids))
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+@spotify_disk_cache.memoize(expire=86400, ignore=(0, '_sp'))
+def _cached_artist_top(_sp, artist_id):
+    """Cached artist top tracks lookup"""
+    return _sp.artist_top_tracks(artist_id, country='US')
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+@spotify_disk_cache.memoize(expire=86400, ignore=(0, '_sp'))
+def _cached_related(_sp, artist_id):
+    """Cached related artists lookup"""
+    return _sp.artist_related_artists(artist_id)
 
 
 def fetch_song(sp, query):
@@ -100,7 +126,12 @@ def fetch_song(sp, query):
         if not query or not query.strip():
             return None, "Empty search query"
         
-        results = sp.search(q=query.strip(), type='track', limit=1)
+        # Per-session memo in front of the shared cache
+        search_cache = st.session_state.setdefault('_search_cache', {})
+        query = query.strip()
+        if query not in search_cache:
+            search_cache[query] = _cached_search(sp, query, 1)
+        results = search_cache[query]
         
         if results['tracks']['items']:
             return results['tracks']['items'][0], None
@@ -110,207 +141,348 @@ def fetch_song(sp, query):
         return None, f"Search error: {str(e)}"
 
 
+def _write_track_part(rows, path):
+    """Write track store entries (dict keyed by ID) to one parquet file"""
+    df = pd.DataFrame.from_dict(rows, orient='index').rename_axis('id').reset_index()
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+@st.cache_resource
+def get_track_store():
+    """Audio features keyed by track ID, shared across sessions and seeded from disk"""
+    features = {}
+    parts = sorted(
+        os.path.join(TRACK_STORE_DIR, name)
+        for name in (os.listdir(TRACK_STORE_DIR) if os.path.isdir(TRACK_STORE_DIR) else [])
+        if name.endswith(".parquet")
+    )
+    for part in parts:
+        try:
+            for row in pd.read_parquet(part).to_dict('records'):
+                track_id = row.pop('id')
+                # Parts with different feature sets fill the gaps with NaN; drop them
+                # so lookups fall back to AUDIO_FEATURE_DEFAULTS instead
+                features[track_id] = {k: v for k, v in row.items() if pd.notna(v)}
+        except Exception:
+            pass
+    
+    # Keep the newest entries (later parts win) within the size cap
+    trimmed = len(features) > TRACK_STORE_MAX_SIZE
+    if trimmed:
+        features = dict(itertools.islice(features.items(), len(features) - TRACK_STORE_MAX_SIZE, None))
+    
+    # Compact many small parts, or an over-sized store, into a single file
+    if trimmed or len(parts) > TRACK_STORE_MAX_PARTS:
+        try:
+            _write_track_part(features, os.path.join(TRACK_STORE_DIR, f"{time.time_ns()}.parquet"))
+            for part in parts:
+                os.remove(part)
+        except Exception:
+            pass
+    
+    return {'features': features, 'pending': {}, 'lock': threading.Lock()}
+
+
+def flush_track_store(rows):
+    """Append track store entries to disk as a new part file (no lock needed)"""
+    try:
+        os.makedirs(TRACK_STORE_DIR, exist_ok=True)
+        _write_track_part(rows, os.path.join(TRACK_STORE_DIR, f"{time.time_ns()}-{threading.get_ident()}.parquet"))
+    except Exception:
+        pass
+
+
+def lookup_audio_features(sp, track_ids):
+    """Get audio features by track ID, only querying Spotify for tracks not in the store"""
+    store = get_track_store()
+    known = store['features']
+    missing = [track_id for track_id in dict.fromkeys(track_ids) if track_id not in known]
+    
+    # Failed batches raise, so callers never mistake them for tracks without features
+    fetched = {}
+    for i in range(0, len(missing), AUDIO_FEATURES_BATCH_SIZE):
+        batch = _cached_audio_features(sp, tuple(missing[i:i + AUDIO_FEATURES_BATCH_SIZE]))
+        fetched.update(
+            (f['id'], {col: f[col] for col in AUDIO_FEATURE_DEFAULTS if col in f})
+            for f in batch or [] if f
+        )
+    
+    to_flush = None
+    if fetched:
+        with store['lock']:
+            known.update(fetched)
+            # Evict the oldest entries beyond the size cap (dicts keep insertion order)
+            for track_id in list(itertools.islice(known, max(0, len(known) - TRACK_STORE_MAX_SIZE))):
+                del known[track_id]
+            store['pending'].update(fetched)
+            if len(store['pending']) >= TRACK_STORE_FLUSH_EVERY:
+                to_flush, store['pending'] = store['pending'], {}
+    
+    # Disk I/O happens outside the lock so other sessions aren't blocked
+    if to_flush:
+        flush_track_store(to_flush)
+    
+    result = {}
+    for track_id in track_ids:
+        features = known.get(track_id) or fetched.get(track_id)
+        if features:
+            result[track_id] = features
+    return result
+
+
 def get_audio_features(sp, track_id):
     """Get audio features for a track"""
     try:
-        features = sp.audio_features([track_id])
-        if features and len(features) > 0 and features[0]:
-            return features[0], None
+        features = lookup_audio_features(sp, [track_id]).get(track_id)
+        if features:
+            return features, None
         return {}, "No audio features"
     except Exception as e:
         return {}, f"Error: {str(e)}"
 
 
+def attach_audio_features(df, sp):
+    """Look up audio features for all tracks (batched on misses) and merge them in"""
+    if df.empty:
+        return df
+    return spotify_data.attach_audio_features(df, lookup_audio_features(sp, df['id'].tolist()))
+
+
 def get_track_details(sp, track):
-    """Extract detailed track information"""
+    """Extract detailed track information, memoized per session by track ID"""
     try:
-        audio_features, _ = get_audio_features(sp, track['id'])
+        track_cache = st.session_state.setdefault('_track_cache', {})
+        if track['id'] in track_cache:
+            return track_cache[track['id']], None
         
-        details = {
-            'id': track['id'],
-            'name': track['name'],
-            'artist': ', '.join([artist['name'] for artist in track['artists']]),
-            'album': track['album']['name'],
-            'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None,
-            'preview_url': track['preview_url'],
-            'popularity': track['popularity'],
-            'release_date': track['album']['release_date'],
-            'duration_ms': track['duration_ms'],
-            'external_url': track['external_urls']['spotify'],
-            'artist_ids': [artist['id'] for artist in track['artists']]
-        }
+        details = get_track_metadata(track)
+        audio_features, _ = get_audio_features(sp, track['id'])
         
         # Add audio features with defaults
         details.update({
-            'danceability': audio_features.get('danceability', 0.5),
-            'energy': audio_features.get('energy', 0.5),
-            'valence': audio_features.get('valence', 0.5),
-            'tempo': audio_features.get('tempo', 120),
-            'acousticness': audio_features.get('acousticness', 0.5),
-            'liveness': audio_features.get('liveness', 0.5),
-            'instrumentalness': audio_features.get('instrumentalness', 0.5),
-            'loudness': audio_features.get('loudness', -10),
-            'speechiness': audio_features.get('speechiness', 0.5),
-            'key': audio_features.get('key', 0),
-            'mode': audio_features.get('mode', 1)
+            col: audio_features.get(col, default)
+            for col, default in AUDIO_FEATURE_DEFAULTS.items()
         })
         
+        track_cache[track['id']] = details
         return details, None
     except Exception as e:
         return None, f"Error: {str(e)}"
 
 
 def get_artist_top_tracks(sp, artist_id, limit=10):
-    """Get top tracks from an artist"""
+    """Get top tracks from an artist as raw Spotify track objects"""
     try:
-        results = sp.artist_top_tracks(artist_id, country='US')
-        tracks_data = []
-        
-        for track in results['tracks'][:limit]:
-            track_details, error = get_track_details(sp, track)
-            if track_details and not error:
-                tracks_data.append(track_details)
-        
-        return pd.DataFrame(tracks_data), None
+        results = _cached_artist_top(sp, artist_id)
+        return results['tracks'][:limit], None
     except Exception as e:
-        return pd.DataFrame(), f"Error: {str(e)}"
+        return [], f"Error: {str(e)}"
 
 
 def get_related_artists_tracks(sp, artist_id, limit=20):
-    """Get tracks from related artists"""
+    """Get tracks from related artists as raw Spotify track objects"""
     try:
-        related = sp.artist_related_artists(artist_id)
-        tracks_data = []
-        
-        for artist in related['artists'][:5]:
-            top_tracks = sp.artist_top_tracks(artist['id'], country='US')
-            for track in top_tracks['tracks'][:4]:
-                track_details, error = get_track_details(sp, track)
-                if track_details and not error:
-                    tracks_data.append(track_details)
-                    if len(tracks_data) >= limit:
-                        break
-            if len(tracks_data) >= limit:
-                break
-        
-        return pd.DataFrame(tracks_data), None
+        related = _cached_related(sp, artist_id)
+        tracks = []
+        
+        # Fetch the related artists' top tracks concurrently
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            all_top_tracks = executor.map(
+                lambda artist: _cached_artist_top(sp, artist['id']),
+                related['artists'][:5]
+            )
+            for top_tracks in all_top_tracks:
+                tracks.extend(top_tracks['tracks'][:4])
+        
+        return tracks[:limit], None
     except Exception as e:
-        return pd.DataFrame(), f"Error: {str(e)}"
+        return [], f"Error: {str(e)}"
 
 
-def recommend_songs(sp, seed_track_details, num_recommendations=10, filters=None):
-    """Get recommendations using multiple strategies"""
+def get_search_tracks(sp, seed_track_details, limit=20):
+    """Search for tracks similar to the seed as raw Spotify track objects"""
     try:
-        all_tracks = []
-        
-        # Strategy 1: Get artist's other tracks
-        if seed_track_details.get('artist_ids'):
-            artist_id = seed_track_details['artist_ids'][0]
-            artist_tracks, _ = get_artist_top_tracks(sp, artist_id, limit=15)
-            if not artist_tracks.empty:
-                all_tracks.append(artist_tracks)
+        search_query = f"{seed_track_details['name']} {seed_track_details['artist']}"
+        search_results = _cached_search(sp, search_query, limit)
+        return search_results['tracks']['items'], None
+    except Exception as e:
+        return [], f"Error: {str(e)}"
+
+
+def _cosine_sims_numpy(X, q):
+    """Cosine similarity of each row of X to q"""
+    X = X / (np.linalg.norm(X, axis=1, keepdims=True) + 1e-12)
+    return X @ (q / (np.linalg.norm(q) + 1e-12))
+
+
+@jit_or_fallback(_cosine_sims_numpy)
+def _cosine_sims(X, q):
+    """Compiled equivalent of _cosine_sims_numpy (normalize and dot in one pass)"""
+    n, d = X.shape
+    q_norm = 0.0
+    for j in range(d):
+        q_norm += q[j] * q[j]
+    q_norm = np.sqrt(q_norm) + 1e-12
+    
+    sims = np.empty(n, dtype=np.float32)
+    for i in range(n):
+        dot = 0.0
+        norm = 0.0
+        for j in range(d):
+            dot += X[i, j] * q[j]
+            norm += X[i, j] * X[i, j]
+        sims[i] = dot / ((np.sqrt(norm) + 1e-12) * q_norm)
+    return sims
+
+
+def _cosine_topk(X, q, k):
+    """Cosine similarity of each row of X to q; returns (top-k indices, similarities)"""
+    sims = _cosine_sims(X, q)
+    return top_k_indices(sims, k), sims
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def get_candidate_pool(_sp, seed_id, _seed_track_details):
+    """Gather candidate tracks with audio features for a seed, cached by seed ID
+    
+    Returns a DataFrame with POOL_COLUMNS and a dict of the remaining
+    metadata keyed by track ID. Raises if any strategy or feature lookup
+    fails, so incomplete pools are never cached.
+    """
+    sp, seed_track_details = _sp, _seed_track_details
+    
+    # Raw tracks keyed by ID, so overlapping results are only processed once
+    unique_tracks = {}
+    errors = []
+    
+    # Run the independent strategies concurrently
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = []
         
-        # Strategy 2: Get tracks from related artists
         if seed_track_details.get('artist_ids'):
             artist_id = seed_track_details['artist_ids'][0]
-            related_tracks, _ = get_related_artists_tracks(sp, artist_id, limit=25)
-            if not related_tracks.empty:
-                all_tracks.append(related_tracks)
+            # Strategy 1: Get artist's other tracks
+            futures.append(executor.submit(get_artist_top_tracks, sp, artist_id, 15))
+            # Strategy 2: Get tracks from related artists
+            futures.append(executor.submit(get_related_artists_tracks, sp, artist_id, 25))
         
         # Strategy 3: Search similar tracks
-        try:
-            search_query = f"{seed_track_details['name']} {seed_track_details['artist']}"
-            search_results = sp.search(q=search_query, type='track', limit=20)
-            search_tracks = []
-            for track in search_results['tracks']['items']:
-                track_details, error = get_track_details(sp, track)
-                if track_details and not error:
-                    search_tracks.append(track_details)
-            if search_tracks:
-                all_tracks.append(pd.DataFrame(search_tracks))
-        except:
-            pass
-        
-        if not all_tracks:
-            return pd.DataFrame(), "Could not find recommendations"
-        
-        # Combine all tracks
-        df = pd.concat(all_tracks, ignore_index=True)
-        
-        # Remove seed track
-        df = df[df['id'] != seed_track_details['id']]
-        
-        # Remove duplicates
-        df = df.drop_duplicates(subset=['id'])
+        futures.append(executor.submit(get_search_tracks, sp, seed_track_details, 20))
+        
+        # Collect in submission order so deduplication stays deterministic
+        for future in futures:
+            tracks, error = future.result()
+            if error:
+                errors.append(error)
+            for track in tracks:
+                if track:
+                    unique_tracks.setdefault(track['id'], track)
+    
+    if errors:
+        raise RuntimeError(f"Could not gather candidates ({'; '.join(errors)})")
+    
+    # Remove seed track
+    unique_tracks.pop(seed_id, None)
+    
+    # Fetch audio features for the whole pool in one batch, so changing
+    # filters only re-filters in memory
+    df = attach_audio_features(build_tracks_dataframe(unique_tracks.values()), sp)
+    if df.empty:
+        return pd.DataFrame(columns=POOL_COLUMNS), {}
+    
+    # Split into the columns used for filtering/ranking and display-only
+    # metadata keyed by ID, which is only looked up for the final top-K
+    metadata = df.drop(columns=POOL_COLUMNS).set_index(df['id']).to_dict('index')
+    return df[POOL_COLUMNS], metadata
+
+
+def recommend_songs(sp, seed_track_details, num_recommendations=10, filters=None):
+    """Get recommendations using multiple strategies"""
+    try:
+        df, metadata = get_candidate_pool(sp, seed_track_details['id'], seed_track_details)
         
         if df.empty:
             return pd.DataFrame(), "No recommendations found"
         
-        # Apply filters
+        # Apply filters as one combined mask, indexing the frame once
         if filters:
+            mask = np.ones(len(df), dtype=bool)
+            
             if 'popularity_range' in filters:
-                df = df[(df['popularity'] >= filters['popularity_range'][0]) & 
-                       (df['popularity'] <= filters['popularity_range'][1])]
+                pop = df['popularity'].to_numpy()
+                mask &= (pop >= filters['popularity_range'][0]) & (pop <= filters['popularity_range'][1])
             
             if 'year_range' in filters:
-                df['year'] = pd.to_datetime(df['release_date'], errors='coerce').dt.year
-                df = df.dropna(subset=['year'])
-                df = df[(df['year'] >= filters['year_range'][0]) & 
-                       (df['year'] <= filters['year_range'][1])]
+                year = df['year'].to_numpy()
+                mask &= (year >= filters['year_range'][0]) & (year <= filters['year_range'][1])
+            
+            df = df.iloc[np.flatnonzero(mask)]
         
         if df.empty:
             return pd.DataFrame(), "No songs match the filters"
         
         # Calculate similarity
-        feature_cols = ['danceability', 'energy', 'valence', 'tempo', 
-                       'acousticness', 'liveness', 'instrumentalness', 
-                       'loudness', 'speechiness']
-        
-        df_features = df[feature_cols].fillna(0.5)
-        seed_features = np.array([[seed_track_details.get(col, 0.5) for col in feature_cols]])
+        feat = scale_features(df[FEATURE_COLUMNS].fillna(0.5).to_numpy(np.float32, copy=True))
+        seed = scale_features(np.array([seed_track_details.get(col, 0.5) for col in FEATURE_COLUMNS], np.float32))
         
-        scaler = StandardScaler()
-        df_features_scaled = scaler.fit_transform(df_features)
-        seed_features_scaled = scaler.transform(seed_features)
+        idx, sims = _cosine_topk(feat, seed, num_recommendations)
+        top = df.iloc[idx].assign(similarity=sims[idx])
         
-        similarities = cosine_similarity(seed_features_scaled, df_features_scaled)[0]
-        df['similarity'] = similarities
-        
-        recommendations = df.nlargest(min(num_recommendations, len(df)), 'similarity')
+        # Rejoin display metadata for the selected tracks only
+        top_metadata = pd.DataFrame([metadata[track_id] for track_id in top['id']], index=top.index)
+        recommendations = pd.concat([top_metadata, top], axis=1)
         
         return recommendations, None
     except Exception as e:
         return pd.DataFrame(), f"Error: {str(e)}"
 
 
+def fetch_mood_recommendations(sp, mood, num_recommendations=10):
+    """Get mood-based recommendations live, through the app's caches"""
+    return fetch_live_mood_recommendations(
+        sp, mood, num_recommendations,
+        search=_cached_search, lookup_features=lookup_audio_features
+    )
+
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def _read_mood_file(path, mtime):
+    """Read a mood parquet file; mtime is part of the cache key so rebuilt files are picked up"""
+    try:
+        return pd.read_parquet(path)
+    except Exception:
+        return None
+
+
+def load_mood_tracks(mood):
+    """Load pre-fetched mood recommendations (see build_mood_cache.py), if present"""
+    path = os.path.join(DATA_DIR, f"mood_{mood}.parquet")
+    # Checked outside the cache so a missing file is never remembered
+    if not os.path.exists(path):
+        return None
+    return _read_mood_file(path, os.path.getmtime(path))
+
+
 def get_mood_based_recommendations(sp, mood, num_recommendations=10):
-    """Get mood-based recommendations using search"""
-    mood_queries = {
-        'happy': 'happy upbeat pop dance',
-        'chill': 'chill relax ambient calm',
-        'workout': 'workout energy gym motivation',
-        'sad': 'sad emotional melancholy',
-        'party': 'party dance club edm'
-    }
+    """Get mood-based recommendations, from disk when pre-fetched"""
+    if mood not in MOOD_QUERIES:
+        return pd.DataFrame(), "Invalid mood"
     
-    try:
-        if mood not in mood_queries:
-            return pd.DataFrame(), "Invalid mood"
-        
-        query = mood_queries[mood]
-        results = sp.search(q=query, type='track', limit=num_recommendations * 2)
-        
-        tracks_data = []
-        for track in results['tracks']['items']:
-            track_details, error = get_track_details(sp, track)
-            if track_details and not error:
-                tracks_data.append(track_details)
-                if len(tracks_data) >= num_recommendations:
-                    break
-        
-        return pd.DataFrame(tracks_data), None
-    except Exception as e:
-        return pd.DataFrame(), f"Error: {str(e)}"
+    tracks_df = load_mood_tracks(mood)
+    if tracks_df is not None and len(tracks_df) >= num_recommendations:
+        return tracks_df.head(num_recommendations), None
+    
+    return fetch_mood_recommendations(sp, mood, num_recommendations)
+
+
+@st.cache_data(show_spinner=False)
+def _pca_project(features):
+    """Project a float32 feature matrix onto 2 principal components"""
+    standardized = (features - features.mean(0)) / (features.std(0) + 1e-9)
+    U, S, _ = np.linalg.svd(standardized, full_matrices=False)
+    return U[:, :2] * S[:2]
 
 
 def visualize_recommendations(seed_track, recommendations_df):
@@ -319,15 +491,11 @@ def visualize_recommendations(seed_track, recommendations_df):
         return None
     
     try:
-        feature_cols = ['danceability', 'energy', 'valence', 'tempo', 
-                       'acousticness', 'liveness', 'instrumentalness', 
-                       'loudness', 'speechiness']
-        
         all_tracks = recommendations_df.copy()
-        features = all_tracks[feature_cols].fillna(0.5)
+        # _pca_project standardizes each column, so no fixed-range scaling is needed here
+        features = all_tracks[FEATURE_COLUMNS].fillna(0.5).to_numpy(np.float32)
         
-        pca = PCA(n_components=2)
-        coords = pca.fit_transform(StandardScaler().fit_transform(features))
+        coords = _pca_project(features)
         
         all_tracks['x'] = coords[:, 0]
         all_tracks['y'] = coords[:, 1]
@@ -360,7 +528,7 @@ def display_song_card(track, show_similarity=False):
     col1, col2 = st.columns([1, 3])
     
     with col1:
-        if track.get('image_url'):
+        if pd.notna(track.get('image_url')):
             st.image(track['image_url'], width=150)
     
     with col2:
@@ -384,7 +552,7 @@ def display_song_card(track, show_similarity=False):
         
         col_a, col_b = st.columns(2)
         with col_a:
-            if track.get('preview_url'):
+            if pd.notna(track.get('preview_url')):
                 st.audio(track['preview_url'])
             else:
                 st.info("🔇 No preview available")
@@ -392,6 +560,19 @@ def display_song_card(track, show_similarity=False):
             st.link_button("🎧 Open in Spotify", track['external_url'])
 
 
+def render_recommendations(recommendations_df, seed):
+    """Render the similarity map and recommendation cards"""
+    fig = visualize_recommendations(seed, recommendations_df)
+    if fig:
+        st.plotly_chart(fig, use_container_width=True)
+    
+    st.markdown("### 🎵 Recommended Songs")
+    
+    for idx, (_, rec_track) in enumerate(recommendations_df.iterrows(), 1):
+        with st.expander(f"{idx}. {rec_track['name']} - {rec_track['artist']}", expanded=(idx <= 3)):
+            display_song_card(rec_track.to_dict(), show_similarity=True)
+
+
 def main():
     st.title("🎵 Smart Music Recommender")
     st.markdown("### Discover your next favorite song powered by AI and Spotify")
@@ -442,48 +623,47 @@ def main():
                 track, error = fetch_song(sp, search_query)
                 
                 if error:
+                    st.session_state.pop('seed_track', None)
                     st.error(f"❌ {error}")
                 elif track:
                     st.success("✅ Song found!")
                     track_details, error = get_track_details(sp, track)
                     
                     if error:
+                        st.session_state.pop('seed_track', None)
                         st.error(f"❌ Error: {error}")
                     elif track_details:
-                        st.markdown("---")
-                        st.subheader("🎯 Selected Song")
-                        display_song_card(track_details)
-                        
-                        st.markdown("---")
-                        st.subheader("🎁 Recommendations for You")
-                        
-                        with st.spinner("🎵 Generating recommendations..."):
-                            filters = {
-                                'popularity_range': popularity_range,
-                                'year_range': year_range
-                            }
-                            
-                            recommendations, error = recommend_songs(
-                                sp, 
-                                track_details, 
-                                num_recommendations,
-                                filters
-                            )
-                            
-                            if error:
-                                st.error(f"❌ {error}")
-                            elif not recommendations.empty:
-                                fig = visualize_recommendations(track_details, recommendations)
-                                if fig:
-                                    st.plotly_chart(fig, use_container_width=True)
-                                
-                                st.markdown("### 🎵 Recommended Songs")
-                                
-                                for idx, (_, rec_track) in enumerate(recommendations.iterrows(), 1):
-                                    with st.expander(f"{idx}. {rec_track['name']} - {rec_track['artist']}", expanded=(idx <= 3)):
-                                        display_song_card(rec_track.to_dict(), show_similarity=True)
-                            else:
-                                st.warning("⚠️ No recommendations found. Try adjusting filters.")
+                        st.session_state['seed_track'] = track_details
+        
+        # Keep showing the last seed so filter changes re-rank without a new search
+        track_details = st.session_state.get('seed_track')
+        if track_details:
+            st.markdown("---")
+            st.subheader("🎯 Selected Song")
+            display_song_card(track_details)
+            
+            st.markdown("---")
+            st.subheader("🎁 Recommendations for You")
+            
+            with st.spinner("🎵 Generating recommendations..."):
+                filters = {
+                    'popularity_range': popularity_range,
+                    'year_range': year_range
+                }
+                
+                recommendations, error = recommend_songs(
+                    sp, 
+                    track_details, 
+                    num_recommendations,
+                    filters
+                )
+                
+                if error:
+                    st.error(f"❌ {error}")
+                elif not recommendations.empty:
+                    render_recommendations(recommendations, track_details)
+                else:
+                    st.warning("⚠️ No recommendations found. Try adjusting filters.")
     
     with tab2:
         st.header("🎲 Surprise Me!")
@@ -0,0 +1,41 @@
+"""
+Pre-fetch mood recommendations for the Surprise Me tab
+Writes data/mood_<name>.parquet so the app can serve moods from disk
+
+Run at deploy time and refresh weekly, e.g. with cron:
+    0 4 * * 1  cd /path/to/smart-music-recommender && python build_mood_cache.py
+"""
+
+import os
+import sys
+
+from spotify_data import (
+    DATA_DIR, MOOD_CACHE_SIZE, MOOD_QUERIES,
+    connect_spotify, fetch_mood_recommendations, read_secrets_file
+)
+
+
+def main():
+    # Same credentials as the app: .streamlit/secrets.toml, then environment variables
+    sp, status = connect_spotify(read_secrets_file())
+    if status != "success":
+        print(f"Spotify API connection failed: {status}")
+        return 1
+    
+    os.makedirs(DATA_DIR, exist_ok=True)
+    
+    for mood in MOOD_QUERIES:
+        tracks_df, error = fetch_mood_recommendations(sp, mood, MOOD_CACHE_SIZE)
+        if error or tracks_df.empty:
+            print(f"Skipping {mood}: {error or 'no tracks found'}")
+            continue
+        
+        path = os.path.join(DATA_DIR, f"mood_{mood}.parquet")
+        tracks_df.to_parquet(path, index=False)
+        print(f"Saved {len(tracks_df)} {mood} tracks to {path}")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
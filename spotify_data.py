@@ -0,0 +1,288 @@
+"""
+Spotify fetching and ranking helpers for Smart Music Recommender
+Free of Streamlit side effects, so offline scripts (build_mood_cache.py) can
+share them with app.py
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import spotipy
+from spotipy.oauth2 import SpotifyClientCredentials
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+# Audio features used for similarity and visualization
+FEATURE_COLUMNS = ['danceability', 'energy', 'valence', 'tempo',
+                   'acousticness', 'liveness', 'instrumentalness',
+                   'loudness', 'speechiness']
+TEMPO_IDX = FEATURE_COLUMNS.index('tempo')
+LOUDNESS_IDX = FEATURE_COLUMNS.index('loudness')
+
+# Search queries behind each mood
+MOOD_QUERIES = {
+    'happy': 'happy upbeat pop dance',
+    'chill': 'chill relax ambient calm',
+    'workout': 'workout energy gym motivation',
+    'sad': 'sad emotional melancholy',
+    'party': 'party dance club edm'
+}
+
+# Pre-fetched mood results (written by build_mood_cache.py) and the shared track store
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MOOD_CACHE_SIZE = 20  # matches the largest "Number of recommendations" setting
+
+# Streamlit secrets file, also read by offline scripts
+SECRETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamlit", "secrets.toml")
+
+# Reference audio profiles per mood, in FEATURE_COLUMNS order
+# (tempo and loudness pre-scaled like scale_features), as unit vectors
+MOOD_VECTORS = {
+    mood: vector / np.linalg.norm(vector)
+    for mood, vector in {
+        'happy': np.array([0.75, 0.75, 0.85, 0.60, 0.20, 0.20, 0.05, 0.90, 0.08], np.float32),
+        'chill': np.array([0.55, 0.30, 0.45, 0.50, 0.70, 0.10, 0.30, 0.75, 0.05], np.float32),
+        'workout': np.array([0.70, 0.90, 0.60, 0.70, 0.05, 0.20, 0.10, 0.93, 0.10], np.float32),
+        'sad': np.array([0.40, 0.30, 0.20, 0.45, 0.65, 0.12, 0.15, 0.78, 0.05], np.float32),
+        'party': np.array([0.85, 0.85, 0.70, 0.62, 0.10, 0.25, 0.05, 0.92, 0.10], np.float32)
+    }.items()
+}
+
+# Flattened Spotify track fields -> metadata column names
+METADATA_COLUMNS = {
+    'id': 'id',
+    'name': 'name',
+    'album.name': 'album',
+    'preview_url': 'preview_url',
+    'popularity': 'popularity',
+    'album.release_date': 'release_date',
+    'duration_ms': 'duration_ms',
+    'external_urls.spotify': 'external_url'
+}
+
+# Flattened fields a track must have to be usable
+REQUIRED_TRACK_FIELDS = ['id', 'name', 'album.name', 'popularity', 'album.release_date', 'duration_ms']
+
+# Columns of a track metadata DataFrame, in display order
+TRACK_COLUMNS = [
+    'id', 'name', 'artist', 'album', 'image_url', 'preview_url', 'popularity',
+    'release_date', 'year', 'duration_ms', 'external_url', 'artist_ids'
+]
+
+# Explicit dtypes for the numeric metadata columns
+TRACK_DTYPES = {
+    'popularity': np.int16,
+    'year': np.int16,
+    'duration_ms': np.int32
+}
+
+# Spotify's audio-features endpoint accepts up to 100 IDs per request
+AUDIO_FEATURES_BATCH_SIZE = 100
+
+# Audio features with defaults for tracks Spotify has no analysis for
+AUDIO_FEATURE_DEFAULTS = {
+    'danceability': 0.5,
+    'energy': 0.5,
+    'valence': 0.5,
+    'tempo': 120,
+    'acousticness': 0.5,
+    'liveness': 0.5,
+    'instrumentalness': 0.5,
+    'loudness': -10,
+    'speechiness': 0.5,
+    'key': 0,
+    'mode': 1
+}
+
+
+def read_secrets_file(path=SECRETS_PATH):
+    """Read Spotify credentials from a secrets.toml file outside Streamlit"""
+    if tomllib is None or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    except Exception:
+        return {}
+
+
+def connect_spotify(secrets=None):
+    """Create a Spotify client from secrets or environment variables; returns (client, status)"""
+    try:
+        secrets = secrets or {}
+        client_id = secrets.get("SPOTIFY_CLIENT_ID")
+        client_secret = secrets.get("SPOTIFY_CLIENT_SECRET")
+        
+        # Fallback to environment variables
+        if not client_id:
+            client_id = os.environ.get("SPOTIFY_CLIENT_ID")
+            client_secret = os.environ.get("SPOTIFY_CLIENT_SECRET")
+        
+        if not client_id or not client_secret:
+            return None, "missing_credentials"
+        
+        client_id = str(client_id).strip()
+        client_secret = str(client_secret).strip()
+        
+        # Pooled keep-alive connections, sized for the concurrent worker threads
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504)
+            )
+        ))
+        
+        auth_manager = SpotifyClientCredentials(
+            client_id=client_id,
+            client_secret=client_secret,
+            requests_session=session
+        )
+        sp = spotipy.Spotify(auth_manager=auth_manager, requests_session=session)
+        
+        # Test connection
+        sp.search(q="test", type='track', limit=1)
+        
+        return sp, "success"
+        
+    except Exception as e:
+        return None, f"error: {str(e)}"
+
+
+def search_tracks(sp, query, limit=1):
+    """Uncached track search"""
+    return sp.search(q=query, type='track', limit=limit)
+
+
+def fetch_audio_features(sp, track_ids):
+    """Get audio features by track ID in batches, without caching"""
+    features_by_id = {}
+    for i in range(0, len(track_ids), AUDIO_FEATURES_BATCH_SIZE):
+        batch = sp.audio_features(list(track_ids[i:i + AUDIO_FEATURES_BATCH_SIZE]))
+        features_by_id.update(
+            (f['id'], {col: f[col] for col in AUDIO_FEATURE_DEFAULTS if col in f})
+            for f in batch or [] if f
+        )
+    return features_by_id
+
+
+def get_track_metadata(track):
+    """Extract track metadata without any API calls"""
+    return {
+        'id': track['id'],
+        'name': track['name'],
+        'artist': ', '.join([artist['name'] for artist in track['artists']]),
+        'album': track['album']['name'],
+        'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None,
+        'preview_url': track['preview_url'],
+        'popularity': track['popularity'],
+        'release_date': track['album']['release_date'],
+        'year': int(track['album']['release_date'][:4]),
+        'duration_ms': track['duration_ms'],
+        'external_url': track['external_urls']['spotify'],
+        'artist_ids': [artist['id'] for artist in track['artists']]
+    }
+
+
+def build_tracks_dataframe(tracks, limit=None):
+    """Build a metadata DataFrame from raw Spotify track objects"""
+    tracks = [track for track in tracks if track]
+    if limit:
+        tracks = tracks[:limit]
+    if not tracks:
+        return pd.DataFrame(columns=TRACK_COLUMNS)
+    
+    # Flatten nested objects in one pass instead of per-track dict building
+    raw = pd.json_normalize(tracks, max_level=1).reindex(
+        columns=list(METADATA_COLUMNS) + ['artists', 'album.images']
+    )
+    
+    # Skip malformed tracks rather than failing the whole batch
+    year = pd.to_numeric(raw['album.release_date'].astype('string').str[:4], errors='coerce')
+    valid = (
+        raw[REQUIRED_TRACK_FIELDS].notna().all(axis=1)
+        & year.notna()
+        & raw['artists'].map(
+            lambda artists: isinstance(artists, list) and bool(artists)
+            and all(isinstance(a, dict) and 'name' in a and 'id' in a for a in artists)
+        )
+    )
+    raw, year = raw[valid].reset_index(drop=True), year[valid].to_numpy()
+    if raw.empty:
+        return pd.DataFrame(columns=TRACK_COLUMNS)
+    
+    df = raw[list(METADATA_COLUMNS)].rename(columns=METADATA_COLUMNS)
+    df['artist'] = [', '.join(a['name'] for a in artists) for artists in raw['artists']]
+    df['image_url'] = [
+        images[0].get('url') if isinstance(images, list) and images else None
+        for images in raw['album.images']
+    ]
+    df['year'] = year
+    df['artist_ids'] = [[a['id'] for a in artists] for artists in raw['artists']]
+    
+    # Fixed column order and explicit dtypes instead of inferred ones
+    return df[TRACK_COLUMNS].astype(TRACK_DTYPES)
+
+
+def attach_audio_features(df, features_by_id):
+    """Merge audio features (dict keyed by track ID) into a track DataFrame"""
+    if df.empty:
+        return df
+    
+    # Look features up by ID, falling back to defaults for tracks without any
+    track_ids = df['id'].tolist()
+    return df.assign(**{
+        col: [features_by_id.get(track_id, {}).get(col, default) for track_id in track_ids]
+        for col, default in AUDIO_FEATURE_DEFAULTS.items()
+    })
+
+
+def scale_features(features):
+    """Scale tempo and loudness columns to roughly [0, 1] like the other features (in place)"""
+    features[..., TEMPO_IDX] /= 200  # BPM
+    features[..., LOUDNESS_IDX] = (features[..., LOUDNESS_IDX] + 60) / 60  # dB
+    return features
+
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, best first (partial sort)"""
+    k = min(k, len(scores))
+    idx = np.argpartition(scores, -k)[-k:]
+    return idx[np.argsort(-scores[idx])]
+
+
+def fetch_mood_recommendations(sp, mood, num_recommendations=10,
+                               search=search_tracks, lookup_features=fetch_audio_features):
+    """Get mood-based recommendations live from Spotify search
+    
+    search(sp, query, limit) and lookup_features(sp, track_ids) default to
+    uncached Spotify calls; the app passes its cached versions
+    """
+    try:
+        if mood not in MOOD_QUERIES:
+            return pd.DataFrame(), "Invalid mood"
+        
+        query = MOOD_QUERIES[mood]
+        results = search(sp, query, num_recommendations * 2)
+        
+        tracks_df = build_tracks_dataframe(results['tracks']['items'])
+        if tracks_df.empty:
+            return tracks_df, None
+        tracks_df = attach_audio_features(tracks_df, lookup_features(sp, tracks_df['id'].tolist()))
+        
+        # Rank search hits by similarity to the mood's reference audio profile
+        feat = scale_features(tracks_df[FEATURE_COLUMNS].to_numpy(np.float32, copy=True))
+        sims = (feat @ MOOD_VECTORS[mood]) / (np.linalg.norm(feat, axis=1) + 1e-12)
+        
+        return tracks_df.iloc[top_k_indices(sims, num_recommendations)], None
+    except Exception as e:
+        return pd.DataFrame(), f"Error: {str(e)}"
@@ -3,24 +3,55 @@ Utility functions for Smart Music Recommender
 Separates business logic from UI code for better maintainability
 """
 
+import warnings
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.decomposition import PCA
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 import spotipy
+from accel import jit_or_fallback
+
+# Audio features used for similarity; one float32 field per feature so a
+# contiguous (N, len(FEATURE_NAMES)) matrix can be viewed as records
+FEATURE_NAMES = (
+    'danceability', 'energy', 'valence', 'tempo', 'acousticness',
+    'liveness', 'instrumentalness', 'loudness', 'speechiness'
+)
+FEATURE_DTYPE = np.dtype([(name, np.float32) for name in FEATURE_NAMES])
 
 class SpotifyDataProcessor:
     """Handles all Spotify API data processing and feature extraction"""
     
+    METADATA_COLUMNS = (
+        'id', 'name', 'artist', 'album', 'image_url', 'preview_url',
+        'popularity', 'release_date', 'year', 'duration_ms', 'external_url'
+    )
+    
+    AUDIO_FEATURE_KEYS = FEATURE_NAMES + ('key', 'mode')
+    
+    CACHE_SIZE = 1024
+    
     def __init__(self, sp: spotipy.Spotify):
         self.sp = sp
-        self.feature_columns = [
-            'danceability', 'energy', 'valence', 'tempo',
-            'acousticness', 'liveness', 'instrumentalness',
-            'loudness', 'speechiness'
-        ]
+        self._search_cache: OrderedDict = OrderedDict()
+        self._feat_cache: OrderedDict = OrderedDict()
+        self.feature_columns = list(FEATURE_NAMES)
+    
+    @staticmethod
+    def _cache_get(cache: OrderedDict, key):
+        """Return a cached value and mark it as most recently used"""
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+    
+    def _cache_put(self, cache: OrderedDict, key, value) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.CACHE_SIZE:
+            cache.popitem(last=False)
     
     def search_track(self, query: str, limit: int = 1) -> Optional[Dict]:
         """
@@ -33,10 +64,17 @@ class SpotifyDataProcessor:
         Returns:
             Track object or None if not found
         """
+        key = (query.lower(), limit)
+        cached = self._cache_get(self._search_cache, key)
+        if cached is not None:
+            return cached
+        
         try:
             results = self.sp.search(q=query, type='track', limit=limit)
             if results['tracks']['items']:
-                return results['tracks']['items'][0]
+                track = results['tracks']['items'][0]
+                self._cache_put(self._search_cache, key, track)
+                return track
             return None
         except Exception as e:
             print(f"Error searching track: {str(e)}")
@@ -52,58 +90,183 @@ class SpotifyDataProcessor:
         Returns:
             Audio features dictionary or None
         """
+        cached = self._cache_get(self._feat_cache, track_id)
+        if cached is not None:
+            return cached
+        
         try:
             features = self.sp.audio_features(track_id)
-            return features[0] if features else None
+            if features and features[0]:
+                self._cache_put(self._feat_cache, track_id, features[0])
+                return features[0]
+            return None
         except Exception as e:
             print(f"Error fetching audio features: {str(e)}")
             return None
     
-    def extract_track_info(self, track: Dict) -> Optional[Dict]:
+    @staticmethod
+    def has_required_fields(track: Optional[Dict]) -> bool:
         """
-        Extract comprehensive track information including audio features
+        Check that a track object has every field extract_track_metadata needs
         
         Args:
             track: Spotify track object
             
         Returns:
-            Dictionary with track details and audio features
+            True if the track can be converted without errors
         """
-        try:
-            audio_features = self.get_audio_features(track['id'])
+        if not track or not track.get('id') or track.get('name') is None:
+            return False
+        if track.get('popularity') is None or track.get('duration_ms') is None:
+            return False
+        
+        album = track.get('album')
+        if not isinstance(album, dict):
+            return False
+        release_date = album.get('release_date')
+        artists = track.get('artists')
+        return (
+            album.get('name') is not None
+            and isinstance(release_date, str) and release_date[:4].isdigit()
+            and isinstance(artists, list) and bool(artists)
+            and all(isinstance(artist, dict) and artist.get('name') is not None for artist in artists)
+        )
+    
+    def extract_track_metadata(self, track: Dict) -> Dict:
+        """
+        Extract track metadata without any API calls
+        
+        Args:
+            track: Spotify track object (see has_required_fields)
             
-            info = {
-                'id': track['id'],
-                'name': track['name'],
-                'artist': ', '.join([artist['name'] for artist in track['artists']]),
-                'album': track['album']['name'],
-                'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None,
-                'preview_url': track['preview_url'],
-                'popularity': track['popularity'],
-                'release_date': track['album']['release_date'],
-                'duration_ms': track['duration_ms'],
-                'external_url': track['external_urls']['spotify']
-            }
+        Returns:
+            Dictionary with track details
             
-            if audio_features:
-                info.update({
-                    'danceability': audio_features['danceability'],
-                    'energy': audio_features['energy'],
-                    'valence': audio_features['valence'],
-                    'tempo': audio_features['tempo'],
-                    'acousticness': audio_features['acousticness'],
-                    'liveness': audio_features['liveness'],
-                    'instrumentalness': audio_features['instrumentalness'],
-                    'loudness': audio_features['loudness'],
-                    'speechiness': audio_features['speechiness'],
-                    'key': audio_features['key'],
-                    'mode': audio_features['mode']
-                })
+        Raises:
+            KeyError, ValueError or TypeError if required fields are missing
+        """
+        return {
+            'id': track['id'],
+            'name': track['name'],
+            'artist': ', '.join(map(lambda artist: artist['name'], track['artists'])),
+            'album': track['album']['name'],
+            'image_url': (track['album'].get('images') or [{}])[0].get('url'),
+            'preview_url': track.get('preview_url'),
+            'popularity': track['popularity'],
+            'release_date': track['album']['release_date'],
+            'year': int(track['album']['release_date'][:4]),
+            'duration_ms': track['duration_ms'],
+            'external_url': track.get('external_urls', {}).get('spotify')
+        }
+    
+    @classmethod
+    def merge_audio_features(cls, info: Dict, audio_features: Optional[Dict]) -> Dict:
+        """
+        Add audio features to a track metadata dictionary
+        
+        Args:
+            info: Track metadata dictionary (updated in place)
+            audio_features: Audio features dictionary or None
             
-            return info
-        except Exception as e:
-            print(f"Error extracting track info: {str(e)}")
+        Returns:
+            The updated dictionary
+        """
+        if audio_features:
+            info.update({key: audio_features[key] for key in cls.AUDIO_FEATURE_KEYS})
+        return info
+    
+    def get_audio_features_batch(self, track_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Get audio features for many tracks, 100 IDs per API request
+        
+        Args:
+            track_ids: Spotify track IDs
+            
+        Returns:
+            Dictionary mapping track ID to audio features
+        """
+        features_by_id = {}
+        missing = []
+        for track_id in track_ids:
+            cached = self._cache_get(self._feat_cache, track_id)
+            if cached is not None:
+                features_by_id[track_id] = cached
+            else:
+                missing.append(track_id)
+        
+        for i in range(0, len(missing), 100):
+            try:
+                features = self.sp.audio_features(missing[i:i + 100])
+                for f in features or []:
+                    if f:
+                        features_by_id[f['id']] = f
+                        self._cache_put(self._feat_cache, f['id'], f)
+            except Exception as e:
+                print(f"Error fetching audio features: {str(e)}")
+        return features_by_id
+    
+    def extract_track_info(self, track: Dict) -> Optional[Dict]:
+        """
+        Extract comprehensive track information including audio features
+        
+        Args:
+            track: Spotify track object
+            
+        Returns:
+            Dictionary with track details and audio features, or None if
+            the track is missing required fields
+            
+        Raises:
+            KeyError if the audio features response lacks a feature
+        """
+        if not self.has_required_fields(track):
             return None
+        
+        # get_audio_features handles its own network errors
+        audio_features = self.get_audio_features(track['id'])
+        return self.merge_audio_features(self.extract_track_metadata(track), audio_features)
+    
+    def tracks_to_dataframe(self, tracks: List[Dict]) -> pd.DataFrame:
+        """
+        Build a DataFrame of track metadata and audio features
+        
+        Audio features are fetched in batches; malformed tracks are skipped
+        
+        Args:
+            tracks: Spotify track objects
+            
+        Returns:
+            DataFrame with one row per valid track
+        """
+        valid_tracks = [track for track in tracks if self.has_required_fields(track)]
+        if len(valid_tracks) < len(tracks):
+            print(f"Skipping {len(tracks) - len(valid_tracks)} malformed tracks")
+        tracks = valid_tracks
+        features_by_id = self.get_audio_features_batch([track['id'] for track in tracks])
+        
+        # Build column lists (structure of arrays) rather than one dict per row;
+        # similarity features go straight into one contiguous float32 matrix
+        columns = {col: [] for col in self.METADATA_COLUMNS}
+        extra_keys = self.AUDIO_FEATURE_KEYS[len(FEATURE_NAMES):]
+        extra_columns = {key: [] for key in extra_keys}
+        feature_matrix = np.full((len(tracks), len(FEATURE_NAMES)), np.nan, dtype=np.float32)
+        feature_records = feature_matrix.view(FEATURE_DTYPE).ravel()
+        n = 0
+        for track in tracks:
+            track_info = self.extract_track_metadata(track)
+            for col in self.METADATA_COLUMNS:
+                columns[col].append(track_info[col])
+            audio_features = features_by_id.get(track['id']) or {}
+            if audio_features:
+                # Missing keys become NaN for this row only
+                feature_records[n] = tuple(audio_features.get(name, np.nan) for name in FEATURE_NAMES)
+            for key in extra_keys:
+                extra_columns[key].append(audio_features.get(key))
+            n += 1
+        
+        columns.update(zip(FEATURE_NAMES, feature_matrix[:n].T))
+        columns.update(extra_columns)
+        return pd.DataFrame(columns)
     
     def get_recommendations_pool(self, seed_track_id: str, limit: int = 50) -> pd.DataFrame:
         """
@@ -122,30 +285,106 @@ class SpotifyDataProcessor:
                 limit=limit
             )
             
-            tracks_data = []
-            for track in recommendations['tracks']:
-                track_info = self.extract_track_info(track)
-                if track_info:
-                    tracks_data.append(track_info)
-            
-            return pd.DataFrame(tracks_data)
+            return self.tracks_to_dataframe(recommendations['tracks'])
         except Exception as e:
             print(f"Error getting recommendations: {str(e)}")
             return pd.DataFrame()
 
 
+def _score_numpy(seed, candidates, mean, std):
+    """Cosine similarity of each standardized candidate row to the standardized seed"""
+    # One scratch buffer (seed in row 0), updated in place with out= throughout
+    work = np.empty((len(candidates) + 1, candidates.shape[1]), dtype=np.float32)
+    work[0] = seed
+    work[1:] = candidates
+    np.subtract(work, mean, out=work)
+    np.divide(work, std, out=work)
+    
+    norms = np.linalg.norm(work, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    np.divide(work, norms, out=work)
+    return np.einsum('j,ij->i', work[0], work[1:], optimize=True)
+
+
+@jit_or_fallback(_score_numpy)
+def score(seed, candidates, mean, std):
+    """Compiled equivalent of _score_numpy (standardize, normalize and dot in one pass)"""
+    n, d = candidates.shape
+    seed_std = np.empty(d, dtype=np.float32)
+    seed_norm = 0.0
+    for j in range(d):
+        seed_std[j] = (seed[j] - mean[j]) / std[j]
+        seed_norm += seed_std[j] * seed_std[j]
+    seed_norm = max(np.sqrt(seed_norm), 1e-12)
+    
+    out = np.empty(n, dtype=np.float32)
+    for i in range(n):
+        dot = 0.0
+        norm = 0.0
+        for j in range(d):
+            x = (candidates[i, j] - mean[j]) / std[j]
+            dot += x * seed_std[j]
+            norm += x * x
+        out[i] = dot / (max(np.sqrt(norm), 1e-12) * seed_norm)
+    return out
+
+
 class RecommendationEngine:
     """Content-based recommendation engine using audio features"""
     
-    def __init__(self, feature_columns: List[str]):
-        self.feature_columns = feature_columns
+    def __init__(self, feature_columns: Sequence[str] = FEATURE_NAMES):
+        self.feature_columns = tuple(feature_columns)
+        self._feature_col_list = list(self.feature_columns)
         self.scaler = StandardScaler()
+        # Track IDs of the pool the scaler was fitted on (None until fitted)
+        self._fitted_ids = None
+    
+    def _feature_matrix(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Extract the feature columns as a float32 matrix
+        
+        Missing columns and missing values become 0 in a single conversion
+        
+        Args:
+            df: DataFrame with tracks
+            
+        Returns:
+            Array of shape (len(df), len(feature_columns))
+        """
+        return df.reindex(columns=self._feature_col_list, fill_value=0).to_numpy(
+            dtype=np.float32, na_value=0
+        )
+    
+    def fit(self, candidate_df: pd.DataFrame) -> 'RecommendationEngine':
+        """
+        Fit the feature scaler on a candidate pool
+        
+        recommend() fits on the unfiltered pool, so filtered subsets of it
+        reuse the same statistics. Similarity for rows outside the fitted
+        pool refits on those rows.
+        
+        Args:
+            candidate_df: DataFrame with candidate tracks
+            
+        Returns:
+            The engine itself
+        """
+        self.scaler.fit(self._feature_matrix(candidate_df))
+        self._fitted_ids = frozenset(candidate_df['id']) if 'id' in candidate_df.columns else None
+        return self
+    
+    def _is_fitted_on(self, df: pd.DataFrame) -> bool:
+        """Whether every row of df belongs to the pool the scaler was fitted on"""
+        return (
+            self._fitted_ids is not None and 'id' in df.columns
+            and self._fitted_ids.issuperset(df['id'])
+        )
     
     def calculate_similarity(
         self,
         seed_features: Dict,
         candidate_df: pd.DataFrame
-    ) -> pd.DataFrame:
+    ) -> np.ndarray:
         """
         Calculate cosine similarity between seed track and candidates
         
@@ -154,30 +393,31 @@ class RecommendationEngine:
             candidate_df: DataFrame with candidate tracks
             
         Returns:
-            DataFrame with similarity scores
+            Array of similarity scores, one per candidate row
         """
-        try:
-            # Prepare feature matrices
-            seed_vector = np.array([[seed_features.get(col, 0) for col in self.feature_columns]])
-            candidate_features = candidate_df[self.feature_columns].fillna(0).values
-            
-            # Normalize features
-            all_features = np.vstack([seed_vector, candidate_features])
-            normalized_features = self.scaler.fit_transform(all_features)
-            
-            seed_normalized = normalized_features[0:1]
-            candidates_normalized = normalized_features[1:]
-            
-            # Calculate cosine similarity
-            similarities = cosine_similarity(seed_normalized, candidates_normalized)[0]
-            
-            result_df = candidate_df.copy()
-            result_df['similarity'] = similarities
-            
-            return result_df
-        except Exception as e:
-            print(f"Error calculating similarity: {str(e)}")
-            return candidate_df
+        missing = set(self.feature_columns) - set(candidate_df.columns)
+        if missing:
+            print(f"Error calculating similarity: missing feature columns {sorted(missing)}")
+            return np.zeros(len(candidate_df))
+        if candidate_df.empty:
+            return np.zeros(0, dtype=np.float32)
+        
+        # Prepare feature matrices
+        seed_vector = np.fromiter(
+            (seed_features.get(col, 0) for col in self.feature_columns),
+            dtype=np.float32,
+            count=len(self.feature_columns)
+        )
+        candidate_features = self._feature_matrix(candidate_df)
+        
+        # Subsets of the fitted pool only transform; other rows refit
+        if not self._is_fitted_on(candidate_df):
+            self.fit(candidate_df)
+        mean = self.scaler.mean_.astype(np.float32)
+        std = self.scaler.scale_.astype(np.float32)
+        
+        # Standardize, L2-normalize and dot-product in a single kernel
+        return score(seed_vector, candidate_features, mean, std)
     
     def apply_filters(
         self,
@@ -196,22 +436,19 @@ class RecommendationEngine:
         Returns:
             Filtered DataFrame
         """
-        filtered_df = df.copy()
+        mask = np.ones(len(df), dtype=bool)
         
         if popularity_range:
-            filtered_df = filtered_df[
-                (filtered_df['popularity'] >= popularity_range[0]) &
-                (filtered_df['popularity'] <= popularity_range[1])
-            ]
+            mask &= df['popularity'].between(*popularity_range).to_numpy()
         
         if year_range:
-            filtered_df['year'] = pd.to_datetime(filtered_df['release_date']).dt.year
-            filtered_df = filtered_df[
-                (filtered_df['year'] >= year_range[0]) &
-                (filtered_df['year'] <= year_range[1])
-            ]
+            # 'year' is parsed once at ingest; derive it only for frames built elsewhere
+            if 'year' not in df.columns:
+                df = df.assign(year=df['release_date'].str[:4].astype(int))
+            mask &= df['year'].between(*year_range).to_numpy()
         
-        return filtered_df
+        # Single fancy-index materialization for all filters
+        return df[mask]
     
     def recommend(
         self,
@@ -232,6 +469,10 @@ class RecommendationEngine:
         Returns:
             DataFrame with top N recommendations
         """
+        # Fit on the unfiltered pool so filter changes don't refit
+        if not candidates_df.empty and not self._is_fitted_on(candidates_df):
+            self.fit(candidates_df)
+        
         # Apply filters if provided
         if filters:
             candidates_df = self.apply_filters(
@@ -244,12 +485,15 @@ class RecommendationEngine:
             return pd.DataFrame()
         
         # Calculate similarity
-        df_with_similarity = self.calculate_similarity(seed_track, candidates_df)
+        sims = self.calculate_similarity(seed_track, candidates_df)
         
-        # Sort by similarity and return top N
-        recommendations = df_with_similarity.nlargest(n, 'similarity')
+        # Partial sort: select the top N in O(N), then order only those
+        n = min(n, len(sims))
+        idx = np.argpartition(-sims, n - 1)[:n]
+        idx = idx[np.argsort(-sims[idx])]
         
-        return recommendations
+        # Only the selected rows get copied, with their scores attached
+        return candidates_df.iloc[idx].assign(similarity=sims[idx])
 
 
 class VisualizationHelper:
@@ -265,28 +509,32 @@ class VisualizationHelper:
             feature_columns: List of feature column names
             
         Returns:
-            DataFrame with PCA coordinates
+            DataFrame with PCA coordinates (explained variance ratios of the
+            two components in attrs['explained_variance'])
         """
-        try:
-            features = df[feature_columns].fillna(0).values
-            
-            # Normalize features
-            scaler = StandardScaler()
-            features_normalized = scaler.fit_transform(features)
-            
-            # Apply PCA
-            pca = PCA(n_components=2)
-            coords = pca.fit_transform(features_normalized)
-            
-            result_df = df.copy()
-            result_df['pca_x'] = coords[:, 0]
-            result_df['pca_y'] = coords[:, 1]
-            result_df['explained_variance'] = pca.explained_variance_ratio_
-            
-            return result_df
-        except Exception as e:
-            print(f"Error preparing PCA data: {str(e)}")
+        missing = set(feature_columns) - set(df.columns)
+        if missing:
+            print(f"Error preparing PCA data: missing feature columns {sorted(missing)}")
             return df
+        # Two components need at least two tracks and two features
+        if len(df) < 2 or len(feature_columns) < 2:
+            return df
+        
+        X = df[feature_columns].fillna(0).to_numpy(dtype=np.float32, copy=True)
+        
+        # Standardize, then PCA via a single SVD of the centered matrix
+        X -= X.mean(0)
+        X /= X.std(0).clip(min=1e-12)
+        U, S, Vt = np.linalg.svd(X, full_matrices=False)
+        coords = U[:, :2] * S[:2]
+        explained_variance = (S[:2] ** 2) / (S ** 2).sum()
+        
+        result_df = df.copy()
+        result_df['pca_x'] = coords[:, 0]
+        result_df['pca_y'] = coords[:, 1]
+        result_df.attrs['explained_variance'] = explained_variance
+        
+        return result_df
     
     @staticmethod
     def get_audio_profile(track: Dict, features: List[str]) -> Dict[str, float]:
@@ -366,13 +614,8 @@ class MoodRecommender:
                 **params
             )
             
-            tracks_data = []
-            for track in recommendations['tracks']:
-                track_info = self.data_processor.extract_track_info(track)
-                if track_info:
-                    tracks_data.append(track_info)
-            
-            return pd.DataFrame(tracks_data)
+            # Same batched path as get_recommendations_pool
+            return self.data_processor.tracks_to_dataframe(recommendations['tracks'])
         except Exception as e:
             print(f"Error getting mood recommendations: {str(e)}")
             return pd.DataFrame()
@@ -394,6 +637,23 @@ def format_duration(duration_ms: int) -> str:
     return f"{minutes}:{seconds:02d}"
 
 
+def format_durations_vec(duration_ms: np.ndarray) -> np.ndarray:
+    """
+    Format many durations from milliseconds to MM:SS at once
+    
+    Args:
+        duration_ms: Array or Series of durations in milliseconds
+        
+    Returns:
+        Array of formatted strings (MM:SS)
+    """
+    minutes, seconds = np.divmod(np.asarray(duration_ms, dtype=np.int64) // 1000, 60)
+    return np.char.add(
+        np.char.add(minutes.astype(str), ':'),
+        np.char.zfill(seconds.astype(str), 2)
+    )
+
+
 def calculate_feature_stats(df: pd.DataFrame, feature_columns: List[str]) -> Dict:
     """
     Calculate statistics for audio features
@@ -405,13 +665,28 @@ def calculate_feature_stats(df: pd.DataFrame, feature_columns: List[str]) -> Dic
     Returns:
         Dictionary with statistics
     """
-    stats = {}
-    for col in feature_columns:
-        if col in df.columns:
-            stats[col] = {
-                'mean': df[col].mean(),
-                'std': df[col].std(),
-                'min': df[col].min(),
-                'max': df[col].max()
-            }
-    return stats
\ No newline at end of file
+    columns = [col for col in feature_columns if col in df.columns]
+    if not columns:
+        return {}
+    
+    # One contiguous block, reduced column-wise per statistic
+    arr = df[columns].to_numpy(dtype=np.float64)
+    if arr.shape[0] == 0:
+        # Match pandas: statistics of an empty column are NaN
+        return {
+            col: {'mean': np.nan, 'std': np.nan, 'min': np.nan, 'max': np.nan}
+            for col in columns
+        }
+    
+    # All-NaN columns and single rows give NaN silently, like the pandas reductions
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(arr, axis=0)
+        std = np.nanstd(arr, axis=0, ddof=1)
+        mn = np.nanmin(arr, axis=0)
+        mx = np.nanmax(arr, axis=0)
+    
+    return {
+        col: {'mean': mean[i], 'std': std[i], 'min': mn[i], 'max': mx[i]}
+        for i, col in enumerate(columns)
+    }